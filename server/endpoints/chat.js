@@ -79,7 +79,7 @@ function chatEndpoints(app) {
               if (error) return `Error: ${error}`;
               const base = csvResult.answer ?? csvResult.result ?? csvResult;
               const code = csvResult.code || (csvResult.response && csvResult.response.code);
-              if (code) return `${typeof base === 'string' ? base : JSON.stringify(base)}\n\nCode used (from PandasAI):\n\n\`\`\`python\n${code}\n\`\`\``;
+              if (code) return `${typeof base === 'string' ? base : JSON.stringify(base)}\n\nSQL used:\n\n\`\`\`sql\n${code}\n\`\`\``;
               return base;
             })(),
             metadata: csvResult.metadata || null,
@@ -100,7 +100,7 @@ function chatEndpoints(app) {
               if (error) return `Error: ${error}`;
               const base = csvResult.answer ?? csvResult.result ?? csvResult;
               const code = csvResult.code || (csvResult.response && csvResult.response.code);
-              if (code) return `${typeof base === 'string' ? base : JSON.stringify(base)}\n\nCode used (from PandasAI):\n\n\`\`\`python\n${code}\n\`\`\``;
+              if (code) return `${typeof base === 'string' ? base : JSON.stringify(base)}\n\nSQL used:\n\n\`\`\`sql\n${code}\n\`\`\``;
               return base;
             })(),
             metadata: csvResult.metadata || null,
@@ -236,7 +236,7 @@ function chatEndpoints(app) {
               if (error) return `Error: ${error}`;
               const base = csvResult.answer ?? csvResult.result ?? csvResult;
               const code = csvResult.code || (csvResult.response && csvResult.response.code);
-              if (code) return `${typeof base === 'string' ? base : JSON.stringify(base)}\n\nCode used (from PandasAI):\n\n\`\`\`python\n${code}\n\`\`\``;
+              if (code) return `${typeof base === 'string' ? base : JSON.stringify(base)}\n\nSQL used:\n\n\`\`\`sql\n${code}\n\`\`\``;
               return base;
             })(),
             metadata: csvResult.metadata || null,
@@ -257,7 +257,7 @@ function chatEndpoints(app) {
               if (error) return `Error: ${error}`;
               const base = csvResult.answer ?? csvResult.result ?? csvResult;
               const code = csvResult.code || (csvResult.response && csvResult.response.code);
-              if (code) return `${typeof base === 'string' ? base : JSON.stringify(base)}\n\nCode used (from PandasAI):\n\n\`\`\`python\n${code}\n\`\`\``;
+              if (code) return `${typeof base === 'string' ? base : JSON.stringify(base)}\n\nSQL used:\n\n\`\`\`sql\n${code}\n\`\`\``;
               return base;
             })(),
             metadata: csvResult.metadata || null,
@@ -340,7 +340,7 @@ function chatEndpoints(app) {
           console.log("[DEBUG] User query:", message);
           console.log("[DEBUG] Matched header/value pairs:", matches);
 
-          // Detect aggregation/range intent to route to PandasAI
+          // Detect aggregation/range intent to route to the NL (LLM-generated SQL) path
           const hasAggregation = /\b(average|avg|mean|sum|count|min|max|median|std|variance|percent|percentage|total)\b/i.test(message);
           const pastYearsMatch = message.match(/past\s+(\d+)\s+years?/i);
           const explicitYearMatch = message.match(/\b(19\d{2}|20\d{2})\b/g);
@@ -394,9 +394,9 @@ function chatEndpoints(app) {
             }
             console.log('[DEBUG] Full doc.metadata:', metadata);
 
-            // Prefer PandasAI for aggregation/range or when SQL is not generated
+            // Prefer the NL path for aggregation/range or when SQL is not generated
             if (!isDirectSql && (hasAggregation || pastYearsMatch) && !sqlQuery) {
-              console.log('[DEBUG] Routing to PandasAI via /api/query-csv for NL question');
+              console.log('[DEBUG] Routing to NL path via /api/query-csv for NL question');
               // Prefer passing the JSON filename to avoid DB lookups and resolve ambiguity
               let fileKey = null;
               if (metadata && (metadata.name || metadata.title)) {
@@ -410,7 +410,7 @@ function chatEndpoints(app) {
               };
               console.log('[DEBUG] /api/query-csv payload:', payload);
 
-              // Add timeout so chat does not hang if PandasAI/Ollama stalls
+              // Add timeout so chat does not hang if Ollama stalls
               const { AbortController } = require('abort-controller');
               const controller = new AbortController();
               const startTs = Date.now();
@@ -434,11 +434,11 @@ function chatEndpoints(app) {
                 console.log('[DEBUG] /api/query-csv request failed after ms:', Date.now() - startTs, 'error:', e.message);
                 data = { success: false, error: e.message };
               }
-              console.log('[DEBUG] /api/query-csv (PandasAI) response:', data);
+              console.log('[DEBUG] /api/query-csv (NL) response:', data);
               if (data.success && data.response) {
                 const base = data.response.answer ?? data.response.result ?? data.response;
                 const code = data.response.code;
-                const text = `${typeof base === 'string' ? base : JSON.stringify(base)}${code ? `\n\nCode used (from PandasAI):\n\n\`\`\`python\n${code}\n\`\`\`` : ''}`;
+                const text = `${typeof base === 'string' ? base : JSON.stringify(base)}${code ? `\n\nSQL used:\n\n\`\`\`sql\n${code}\n\`\`\`` : ''}`;
                 require("../utils/helpers/chat/responses").writeResponseChunk(response, {
                   uuid: require('uuid').v4(),
                   type: "textResponseChunk",
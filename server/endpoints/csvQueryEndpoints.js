@@ -2,9 +2,17 @@ const express = require("express");
 const { PythonShell } = require("python-shell");
 const path = require("path");
 const fs = require("fs");
+const { PythonWorkerPool } = require("../utils/csv/pythonWorkerPool");
 
 const router = express.Router();
 
+// Long-lived PandasAI workers reuse imports, the Ollama client and loaded
+// DataFrames across requests instead of spawning a fresh interpreter each time
+const pandasWorkers = new PythonWorkerPool(
+  path.join(__dirname, "../scripts/pandasai_query.py"),
+  Number(process.env.PANDASAI_WORKERS || 2)
+);
+
 function nowMs() {
   return Date.now();
 }
@@ -170,9 +178,8 @@ async function handleCsvQuery({ documentId, question, tableName = "csvtable", us
   }
 
   // PandasAI path
-  const pandasScriptPath = path.join(__dirname, "../scripts/pandasai_query.py");
   log("PandasAI path chosen.");
-  const pandasResult = await runPython(pandasScriptPath, [absPath, question]);
+  const pandasResult = await pandasWorkers.run({ json_file: absPath, question });
   if (!pandasResult.success) return { success: false, error: pandasResult.error, stderr: pandasResult.stderr };
   return { success: true, response: pandasResult.parsed };
 }
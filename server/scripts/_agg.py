@@ -0,0 +1,182 @@
+"""Deterministic "average <col> for the past N years" aggregator.
+
+Shared by nl_aggregate.py and pandasai_query.py. Inputs may be a pyarrow Table
+or a pandas DataFrame; both are registered with DuckDB, which computes the
+recent-year selection and the average over the two referenced columns.
+"""
+import functools
+import duckdb
+import numpy as np
+import pyarrow as pa
+from rapidfuzz import fuzz, process, utils
+from _debug import dbg
+from _tables import quote_ident
+try:
+    import re2 as re
+except ImportError:
+    import re
+
+# Inline flag: google-re2 has no IGNORECASE constant and rejects int flags
+_AVG_RE = re.compile(r"(?i)average\s+(.+?)\s+for\s+the\s+past\s+(\d+)\s+years?")
+
+
+class _KeepAlnumTable(dict):
+    """str.translate table that keeps [a-z0-9] and deletes every other code point."""
+
+    def __missing__(self, codepoint):
+        self[codepoint] = None
+        return None
+
+
+_KEEP_TABLE = _KeepAlnumTable((c, c) for c in b"abcdefghijklmnopqrstuvwxyz0123456789")
+
+
+@functools.lru_cache(maxsize=512)
+def normalize_name(name) -> str:
+    return str(name).lower().translate(_KEEP_TABLE)
+
+
+def pick_target_column(columns, target_phrase):
+    """Return the column that best fuzzy-matches target_phrase."""
+    columns = list(columns)
+    choices = [utils.default_process(str(c)) for c in columns]
+    candidates = range(len(columns))
+    # Prefer time columns when the question asks about a time
+    if "time" in normalize_name(target_phrase):
+        timed = [i for i in candidates if "time" in normalize_name(columns[i])]
+        if timed:
+            candidates = timed
+    _, _, best = process.extractOne(
+        utils.default_process(target_phrase),
+        {i: choices[i] for i in candidates},
+        scorer=fuzz.token_set_ratio,
+        processor=None,
+    )
+    return columns[best]
+
+
+def _string_year_counts(chunk):
+    # Scan the Arrow offsets/data buffers in place; no per-cell Python objects
+    from _yearscan import count_year_hits
+    offset_type = np.dtype(np.int64 if pa.types.is_large_string(chunk.type) else np.int32)
+    _, offsets_buf, data_buf = chunk.buffers()
+    offsets = np.frombuffer(offsets_buf, dtype=offset_type, count=len(chunk) + 1, offset=chunk.offset * offset_type.itemsize)
+    data = np.frombuffer(data_buf, dtype=np.uint8) if data_buf is not None else np.empty(0, dtype=np.uint8)
+    valid = chunk.is_valid().to_numpy(zero_copy_only=False)
+    return count_year_hits(offsets, data, valid)
+
+
+def _year_counts(column):
+    """(hits, total) for a column under pd.to_numeric(...).dropna().astype(int).between(1900, 2100)."""
+    typ = column.type
+    if pa.types.is_string(typ) or pa.types.is_large_string(typ):
+        counts = [_string_year_counts(chunk) for chunk in column.chunks if len(chunk)]
+        return sum(h for h, _ in counts), sum(n for _, n in counts)
+    if pa.types.is_integer(typ) or pa.types.is_floating(typ) or pa.types.is_boolean(typ):
+        values = column.cast(pa.float64()).to_numpy()
+        values = values[~np.isnan(values)]
+        years = np.trunc(values)
+        return int(((years >= 1900) & (years <= 2100)).sum()), len(values)
+    return 0, 0
+
+
+def detect_year_column(tbl: pa.Table):
+    """Return the first column of tbl whose numeric values are mostly years."""
+    for name, column in zip(tbl.column_names, tbl.columns):
+        hits, total = _year_counts(column)
+        if total > 0 and hits / total > 0.5:
+            return name
+    return None
+
+
+def _avg_timedelta(con, target_col, year_filter, recent_years) -> str:
+    (avg_seconds,) = con.execute(
+        f"SELECT AVG(epoch(TRY_CAST(CAST({quote_ident(target_col)} AS VARCHAR) AS INTERVAL))) FROM t WHERE {year_filter}",
+        [recent_years],
+    ).fetchone()
+    dbg("DEBUG: time avg seconds:", avg_seconds)
+    if avg_seconds is None:
+        raise ValueError("Could not compute average of time column")
+    # Format HH:MM:SS
+    h = int(avg_seconds // 3600)
+    m = int((avg_seconds % 3600) // 60)
+    s = int(avg_seconds % 60)
+    return f"{h:01d}:{m:02d}:{s:02d}"
+
+
+def _avg_numeric(con, target_col, year_filter, recent_years) -> str:
+    (avg_val,) = con.execute(
+        f"SELECT AVG(TRY_CAST({quote_ident(target_col)} AS DOUBLE)) FROM t WHERE {year_filter}",
+        [recent_years],
+    ).fetchone()
+    dbg("DEBUG: numeric avg value:", avg_val)
+    if avg_val is None:
+        raise ValueError("Could not compute average of numeric column")
+    return f"{avg_val:.4f}"
+
+
+_AGGREGATES = {"time": _avg_timedelta, "number": _avg_numeric}
+
+
+def find_year_column(data):
+    """Return the year column of a pyarrow Table or DataFrame, or None."""
+    columns = data.column_names if isinstance(data, pa.Table) else list(data.columns)
+    for c in columns:
+        if "year" in normalize_name(c):
+            return c
+    if not isinstance(data, pa.Table):
+        # Arrow-backed columns convert without copying
+        data = pa.Table.from_pandas(data, preserve_index=False)
+    return detect_year_column(data)
+
+
+def run_average_over_years(data, question: str, year_col=None) -> dict:
+    """Answer "average <col> for the past N years" over a pyarrow Table or DataFrame.
+
+    year_col skips detection when the caller already knows it (e.g. from a snapshot).
+    Returns {"answer": ...} on success, otherwise {"error": ...}.
+    """
+    m = _AVG_RE.search(question)
+    if not m:
+        return {"error": "Question not supported by deterministic aggregator."}
+    target_phrase = m.group(1).strip()
+    years_back = int(m.group(2))
+    dbg("DEBUG: parsed target and years:", {"target_phrase": target_phrase, "years_back": years_back})
+
+    columns = data.column_names if isinstance(data, pa.Table) else list(data.columns)
+    if year_col is None:
+        year_col = find_year_column(data)
+    dbg("DEBUG: detected year_col:", year_col)
+    if year_col is None:
+        return {"error": "Could not detect a 'year' column."}
+
+    con = duckdb.connect()
+    try:
+        con.register("t", data)
+        year_expr = f"TRY_CAST(trunc(TRY_CAST({quote_ident(year_col)} AS DOUBLE)) AS BIGINT)"
+        recent_years = [
+            r[0]
+            for r in con.execute(
+                f"SELECT DISTINCT y FROM (SELECT {year_expr} AS y FROM t) WHERE y IS NOT NULL ORDER BY y DESC LIMIT ?",
+                # LIMIT is a BIGINT; anything larger already covers every year
+                [min(years_back, 2**63 - 1)],
+            ).fetchall()
+        ]
+        if len(recent_years) == 0:
+            return {"error": "No valid year values found."}
+        dbg("DEBUG: recent_years selected:", recent_years)
+
+        # Choose target column by fuzzy match
+        target_col = pick_target_column(columns, target_phrase)
+        dbg("DEBUG: chosen target_col:", target_col)
+        kind = "time" if "time" in normalize_name(target_col) else "number"
+
+        # Aggregate only the two referenced columns inside DuckDB; recent_years
+        # come from the table itself, so the filtered subset is never empty
+        try:
+            value = _AGGREGATES[kind](con, target_col, f"{year_expr} IN (SELECT UNNEST(?::BIGINT[]))", recent_years)
+        except Exception as e:
+            return {"error": f"Deterministic aggregator error: {str(e)}"}
+        return {"answer": f"Average {target_col} over past {years_back} years: {value}"}
+    finally:
+        con.close()
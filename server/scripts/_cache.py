@@ -0,0 +1,104 @@
+"""Parquet snapshots of loaded documents, shared by the CSV query scripts.
+
+A snapshot holds a table as it looked after loading (and, for PandasAI, after
+numeric inference), optionally with a small JSON blob of detection results in
+the parquet schema metadata. Snapshots are keyed by document name, a per-script
+tag, SNAPSHOT_VERSION and the document's mtime, so an edited document is simply
+re-read.
+"""
+import json
+import os
+import re
+import time
+import pyarrow as pa
+import pyarrow.parquet as pq
+from _debug import dbg
+
+cache_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../storage/duckdb-cache"))
+documents_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../storage/documents/custom-documents"))
+
+# Bump whenever loading or type inference changes what a snapshot contains, so
+# snapshots written by older code are ignored and pruned
+SNAPSHOT_VERSION = 2
+
+_META_KEY = b"anythingllm"
+# <document>.<tag>[.v<version>].<mtime_ns>.parquet; unversioned names predate SNAPSHOT_VERSION
+_SNAPSHOT_RE = re.compile(r"(?P<doc>.+)\.(?P<tag>[a-z]+)\.(?:v(?P<version>\d+)\.)?\d+\.parquet")
+# Temp files older than this belong to a writer that died mid-snapshot
+_TMP_MAX_AGE_SECONDS = 3600
+
+
+def snapshot_path(json_file: str, tag: str) -> str:
+    mtime_ns = os.stat(json_file).st_mtime_ns
+    return os.path.join(cache_dir, f"{os.path.basename(json_file)}.{tag}.v{SNAPSHOT_VERSION}.{mtime_ns}.parquet")
+
+
+def prune_snapshots(keep_path: str):
+    """Remove abandoned temp files and snapshots that can no longer be served.
+
+    That covers older versions of a document, older SNAPSHOT_VERSIONs and documents
+    no longer present in documents_dir.
+    """
+    keep_name = os.path.basename(keep_path)
+    keep = _SNAPSHOT_RE.fullmatch(keep_name)
+    try:
+        documents = set(os.listdir(documents_dir))
+    except OSError:
+        documents = None
+    now = time.time()
+    for fname in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, fname)
+        try:
+            if fname.endswith(".tmp"):
+                if now - os.path.getmtime(path) > _TMP_MAX_AGE_SECONDS:
+                    os.remove(path)
+                continue
+            m = _SNAPSHOT_RE.fullmatch(fname)
+            if m is None or fname == keep_name:
+                continue
+            superseded = (m.group("doc"), m.group("tag")) == (keep.group("doc"), keep.group("tag"))
+            outdated = m.group("version") != str(SNAPSHOT_VERSION)
+            orphaned = documents is not None and m.group("doc") not in documents
+            if superseded or outdated or orphaned:
+                os.remove(path)
+        except OSError as e:
+            dbg("DEBUG: failed to prune snapshot:", fname, str(e))
+
+
+def write_snapshot(json_file: str, tag: str, write):
+    """Call write(tmp_path) to produce a parquet file and publish it as the current snapshot.
+
+    Failures are non-fatal: a missing snapshot only means the next query re-reads the document.
+    """
+    path = snapshot_path(json_file, tag)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        write(tmp_path)
+        os.replace(tmp_path, path)
+        prune_snapshots(path)
+    except Exception as e:
+        dbg("DEBUG: failed to write parquet snapshot:", str(e))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_snapshot(json_file: str, tag: str):
+    """Return (table, meta) from a current snapshot of json_file, or None."""
+    path = snapshot_path(json_file, tag)
+    if not os.path.exists(path):
+        return None
+    try:
+        tbl = pq.read_table(path)
+    except (OSError, pa.ArrowException) as e:
+        dbg("DEBUG: failed to read parquet snapshot:", str(e))
+        return None
+    meta = json.loads((tbl.schema.metadata or {}).get(_META_KEY, b"{}"))
+    dbg("DEBUG: using parquet snapshot:", path)
+    return tbl, meta
+
+
+def store_snapshot(json_file: str, tag: str, tbl: pa.Table, meta: dict):
+    """Write an Arrow table and its meta blob as the current snapshot of json_file."""
+    tbl = tbl.replace_schema_metadata({**(tbl.schema.metadata or {}), _META_KEY: json.dumps(meta)})
+    write_snapshot(json_file, tag, lambda tmp_path: pq.write_table(tbl, tmp_path, compression="zstd"))
@@ -0,0 +1,14 @@
+"""Opt-in stderr diagnostics for the CSV query scripts.
+
+Set DEBUG_SCRIPTS=1 to enable; otherwise dbg() is a no-op so short queries do
+not pay for dozens of blocking stderr writes.
+"""
+import os
+import sys
+
+DEBUG = os.environ.get("DEBUG_SCRIPTS") == "1"
+
+
+def dbg(*args, **kwargs):
+    if DEBUG:
+        print(*args, **kwargs, file=sys.stderr)
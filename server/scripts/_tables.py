@@ -0,0 +1,50 @@
+"""Row loading, Arrow table building and SQL quoting shared by the CSV query scripts.
+
+Kept free of heavy imports so query_csv.py can use it without loading the
+aggregator's numba/rapidfuzz dependencies.
+"""
+import ijson.backends.python as ijson_python
+import pyarrow as pa
+from ijson.common import JSONError
+try:
+    import ijson.backends.yajl2_c as ijson
+except ImportError:
+    import ijson
+
+
+def json_items(json_path, prefix):
+    """Return every item at the ijson prefix in json_path, streaming the file.
+
+    yajl (the C backend) rejects integers outside int64 with "integer overflow";
+    such documents are re-read with the pure-Python backend, which keeps them as ints.
+    """
+    try:
+        with open(json_path, "rb") as f:
+            return list(ijson.items(f, prefix, use_float=True))
+    except JSONError as e:
+        if ijson is ijson_python or "integer overflow" not in str(e):
+            raise
+    with open(json_path, "rb") as f:
+        return list(ijson_python.items(f, prefix, use_float=True))
+
+
+def rows_to_arrow(rows):
+    """Build an Arrow table from row dicts, keeping every key seen in any row."""
+    keys = list(dict.fromkeys(k for row in rows for k in row))
+    columns = {}
+    for k in keys:
+        values = [row.get(k) for row in rows]
+        try:
+            columns[k] = pa.array(values)
+        except (pa.ArrowException, OverflowError):
+            # Mixed-type column or an integer beyond int64: fall back to strings like the CSV source
+            columns[k] = pa.array([None if v is None else str(v) for v in values], type=pa.string())
+    return pa.table(columns)
+
+
+def quote_ident(name) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def quote_literal(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
@@ -0,0 +1,107 @@
+"""Numba kernel behind _agg.detect_year_column.
+
+Imported only when a string column actually has to be scanned, so scripts that
+already know their year column never pay for loading numba or compiling.
+"""
+from numba import njit, prange
+
+# Significant digits kept in the mantissa; more cannot shift a value across a
+# year boundary
+_MAX_DIGITS = 19
+
+
+@njit(cache=True)
+def _is_space(c):
+    return c == 32 or 9 <= c <= 13
+
+
+@njit(cache=True)
+def _is_inf(data, j, end):
+    # "inf" or "infinity", case-insensitive
+    n = end - j
+    if n != 3 and n != 8:
+        return False
+    word = b"infinity"
+    for k in range(n):
+        if data[j + k] | 32 != word[k]:
+            return False
+    return True
+
+
+@njit(parallel=True, cache=True)
+def count_year_hits(offsets, data, valid):
+    """Return (hits, total) for an Arrow string array given as raw buffers.
+
+    A value counts toward `total` when pd.to_numeric would parse it and toward
+    `hits` when its integer part falls within 1900-2100, the same rule as
+    pd.to_numeric(s, errors="coerce").dropna().astype(int).between(1900, 2100).
+    """
+    n = len(offsets) - 1
+    hits = 0
+    total = 0
+    for i in prange(n):
+        if not valid[i]:
+            continue
+        j = offsets[i]
+        end = offsets[i + 1]
+        while j < end and _is_space(data[j]):
+            j += 1
+        while end > j and _is_space(data[end - 1]):
+            end -= 1
+        neg = False
+        if j < end and (data[j] == 43 or data[j] == 45):
+            neg = data[j] == 45
+            j += 1
+        if j < end and data[j] | 32 == 105:
+            if _is_inf(data, j, end):
+                total += 1
+            continue
+        mant = 0.0
+        scale = 0
+        sig = 0
+        digits = 0
+        while j < end and 48 <= data[j] <= 57:
+            if sig < _MAX_DIGITS:
+                mant = mant * 10.0 + (data[j] - 48)
+                if mant > 0.0:
+                    sig += 1
+            else:
+                scale += 1
+            digits += 1
+            j += 1
+        if j < end and data[j] == 46:
+            j += 1
+            while j < end and 48 <= data[j] <= 57:
+                if sig < _MAX_DIGITS:
+                    mant = mant * 10.0 + (data[j] - 48)
+                    scale -= 1
+                    if mant > 0.0:
+                        sig += 1
+                digits += 1
+                j += 1
+        if digits == 0:
+            continue
+        if j < end and data[j] | 32 == 101:
+            j += 1
+            exp_neg = False
+            if j < end and (data[j] == 43 or data[j] == 45):
+                exp_neg = data[j] == 45
+                j += 1
+            exp = 0
+            exp_digits = 0
+            while j < end and 48 <= data[j] <= 57:
+                if exp < 100000:
+                    exp = exp * 10 + (data[j] - 48)
+                exp_digits += 1
+                j += 1
+            if exp_digits == 0:
+                continue
+            scale += -exp if exp_neg else exp
+        if j != end:
+            continue
+        total += 1
+        if not neg and mant > 0.0:
+            value = mant * 10.0 ** scale
+            if 1900.0 <= value < 2101.0:
+                hits += 1
+    return hits, total
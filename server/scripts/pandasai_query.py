@@ -1,176 +1,266 @@
 import sys
 import os
 import json
-import re
 import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import duckdb
 import pandas as pd
-from pandasai import SmartDataframe
-from pandasai.llm.ollama import Ollama
+import pyarrow as pa
+import sqlglot
+from _agg import find_year_column, run_average_over_years
+from _cache import load_snapshot, store_snapshot
+from _debug import dbg
+from _tables import json_items, quote_ident, rows_to_arrow
+try:
+    import re2 as re
+except ImportError:
+    import re
 
-print("DEBUG: argv:", sys.argv, file=sys.stderr)
+_SQL_BLOCK_RE = re.compile(r"(?is)```(?:sql|duckdb)?\s*(.*?)```")
 
-# Usage: python pandasai_query.py <json_file> <question>
-if len(sys.argv) < 3:
-    print(json.dumps({"error": "Usage: python pandasai_query.py <json_file> <question>"}))
-    sys.exit(1)
+# 2:58, 2:58:49, 12/31/2021, 2021-12-31
+_TIME_RE = re.compile(r"^(?:\d{1,2}:\d{2}(?::\d{2})?|\d{1,2}/\d{1,2}/\d{2,4}|\d{4}-\d{2}-\d{2})$")
 
-json_file = sys.argv[1]
-question = sys.argv[2]
-print("DEBUG: inputs:", {"json_file": json_file, "question": question}, file=sys.stderr)
+def to_numeric(series: pd.Series) -> pd.Series:
+    converted = pd.to_numeric(series, errors="coerce")
+    # Arrow-backed to_numeric leaves unparseable values as NaN rather than null;
+    # NaN != NaN, so this nulls them while integer results keep their int64 type
+    return converted.where(converted == converted)
 
-# Load DataFrame from JSON file (expects structuredData.data)
-if not os.path.exists(json_file):
-    print(json.dumps({"error": f"File not found: {json_file}"}))
-    sys.exit(1)
+def try_numeric(series: pd.Series):
+    """Return the numeric conversion of series if most values parse, else None."""
+    # Probe a head sample first so clearly textual columns skip the full parse
+    if to_numeric(series.iloc[:256]).notna().mean() < 0.2:
+        return None
+    converted = to_numeric(series)
+    return converted if converted.notna().sum() > len(series) * 0.5 else None
 
-load_start = time.time()
-try:
-    with open(json_file, "r", encoding="utf-8") as f:
-        doc = json.load(f)
-    if (
-        "metadata" in doc
-        and "structuredData" in doc["metadata"]
-        and "data" in doc["metadata"]["structuredData"]
-    ):
-        data = doc["metadata"]["structuredData"]["data"]
-    else:
-        print(json.dumps({"error": "No structuredData.data found in JSON file."}))
-        sys.exit(1)
-    df = pd.DataFrame(data)
-    print("DEBUG: load time (s):", time.time() - load_start, file=sys.stderr)
+def looks_like_time_or_date(series: pd.Series) -> bool:
+    sample = series.dropna().head(10).astype(str).str.strip()
+    return bool(sample.str.match(_TIME_RE.pattern).any())
+
+# Recently used frames and their DuckDB connection, keyed by json_file and
+# tagged with its mtime so a serving worker only reloads a document after it
+# changes on disk. Bounded so a long-lived worker does not keep every document
+# it has ever seen; PANDASAI_FRAME_CACHE_SIZE overrides the default.
+_FRAME_CACHE = OrderedDict()
+_FRAME_CACHE_SIZE = max(1, int(os.environ.get("PANDASAI_FRAME_CACHE_SIZE", "4")))
+
+OLLAMA_TIMEOUT_SECONDS = 60
+
+
+def _arrow_string_dtype(arrow_type):
+    # Text columns are string[pyarrow] on a fresh load; other columns are
+    # restored from the pandas metadata stored with the snapshot
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+
+def load_frame(json_file: str):
+    """Return (df, meta) for json_file, reusing its parquet snapshot when current."""
+    load_start = time.time()
+    snapshot = load_snapshot(json_file, "frame")
+    if snapshot is not None:
+        # Typed columns come back as written, so numeric inference is skipped
+        tbl, meta = snapshot
+        dbg("DEBUG: load time (s):", time.time() - load_start)
+        return tbl.to_pandas(types_mapper=_arrow_string_dtype), meta
+
+    # Stream rows out of metadata.structuredData.data instead of loading the whole document
+    data = json_items(json_file, "metadata.structuredData.data.item")
+    if not data:
+        raise LookupError("No structuredData.data found in JSON file.")
+    # Arrow-backed columns avoid boxing every cell as a Python object
+    df = rows_to_arrow(data).to_pandas(types_mapper=pd.ArrowDtype)
+    dbg("DEBUG: load time (s):", time.time() - load_start)
 
     # 🔁 Auto-detect numeric columns (skip times/dates)
-    def looks_like_time_or_date(series: pd.Series) -> bool:
-        sample = series.dropna().astype(str).head(10).tolist()
-        time_patterns = [
-            r"^\d{1,2}:\d{2}$",            # 2:58
-            r"^\d{1,2}:\d{2}:\d{2}$",      # 2:58:49
-            r"^\d{1,2}/\d{1,2}/\d{2,4}$",  # 12/31/2021
-            r"^\d{4}-\d{2}-\d{2}$"         # 2021-12-31
-        ]
-        for val in sample:
-            for pattern in time_patterns:
-                if re.match(pattern, val.strip()):
-                    return True
-        return False
-
-    print("DEBUG: original columns:", list(df.columns), file=sys.stderr)
+    dbg("DEBUG: original columns:", list(df.columns))
+    candidate_cols = [
+        col for col in df.columns
+        if pd.api.types.is_string_dtype(df[col]) and not looks_like_time_or_date(df[col])
+    ]
     conv_count = 0
-    for col in df.columns:
-        if df[col].dtype == "object" and not looks_like_time_or_date(df[col]):
-            try_convert = pd.to_numeric(df[col], errors="coerce")
-            if try_convert.notna().sum() > len(df) * 0.5:
+    if candidate_cols:
+        # Columns convert independently and the numeric cast runs outside the GIL
+        with ThreadPoolExecutor(max_workers=min(8, len(candidate_cols))) as ex:
+            converted = list(ex.map(lambda col: try_numeric(df[col]), candidate_cols))
+        for col, try_convert in zip(candidate_cols, converted):
+            if try_convert is not None:
                 df[col] = try_convert
                 conv_count += 1
-    print("DEBUG: numeric conversions applied:", conv_count, file=sys.stderr)
-except Exception as e:
-    print(json.dumps({"error": f"Failed to load DataFrame: {str(e)}"}))
-    sys.exit(1)
+    dbg("DEBUG: numeric conversions applied:", conv_count)
+    meta = {"year_col": find_year_column(df)}
+    store_snapshot(json_file, "frame", pa.Table.from_pandas(df, preserve_index=False), meta)
+    return df, meta
 
-# Deterministic aggregator: handle patterns like "average <col> for the past N years"
-def normalize_name(name: str) -> str:
-    return re.sub(r"[^a-z0-9]", "", str(name).lower())
 
-try:
-    pattern = re.search(r"average\s+(.+?)\s+for\s+the\s+past\s+(\d+)\s+years?", question, re.IGNORECASE)
-    if pattern:
-        target_phrase = pattern.group(1).strip()
-        years_back = int(pattern.group(2))
-
-        # Find year-like column
-        year_col = None
-        for c in df.columns:
-            if "year" in normalize_name(c):
-                year_col = c
-                break
-        if year_col is None:
-            # Try to detect a year column by numeric 4-digit values
-            for c in df.columns:
-                ser = pd.to_numeric(df[c], errors="coerce")
-                if ser.notna().sum() > 0:
-                    # Heuristic: majority are in plausible year range 1900-2100
-                    vals = ser.dropna().astype(int)
-                    if (vals.between(1900, 2100).mean() > 0.5):
-                        year_col = c
-                        break
-
-        if year_col is not None:
-            # Select most recent N years present in data
-            years_numeric = pd.to_numeric(df[year_col], errors="coerce")
-            valid_years = years_numeric.dropna().astype(int)
-            if len(valid_years) > 0:
-                recent_years = sorted(valid_years.unique(), reverse=True)[:years_back]
-                subset = df[years_numeric.isin(recent_years)].copy()
-
-                # Resolve target column by best fuzzy match of target_phrase
-                def score(col: str) -> int:
-                    cn = normalize_name(col)
-                    tp = normalize_name(target_phrase)
-                    # simple overlap score
-                    common = set(re.findall(r"[a-z]+", cn)) & set(re.findall(r"[a-z]+", tp))
-                    bonus = 2 if ("time" in cn and "time" in tp) else 0
-                    return len(common) + bonus
-
-                target_col = max(df.columns, key=score)
-                target_norm = normalize_name(target_col)
-
-                if "time" in target_norm:
-                    # Convert to timedelta then seconds
-                    td = pd.to_timedelta(subset[target_col].astype(str), errors="coerce")
-                    seconds = td.dt.total_seconds()
-                    avg_seconds = seconds.mean()
-                    if pd.isna(avg_seconds):
-                        raise ValueError("Could not compute average of time column")
-                    # Format HH:MM:SS
-                    h = int(avg_seconds // 3600)
-                    m = int((avg_seconds % 3600) // 60)
-                    s = int(avg_seconds % 60)
-                    answer_str = f"Average {target_col} over past {years_back} years: {h:01d}:{m:02d}:{s:02d}"
-                else:
-                    series = pd.to_numeric(subset[target_col], errors="coerce")
-                    avg_val = series.mean()
-                    if pd.isna(avg_val):
-                        raise ValueError("Could not compute average of numeric column")
-                    answer_str = f"Average {target_col} over past {years_back} years: {avg_val:.4f}"
-
-                print(json.dumps({"answer": answer_str, "code": None}, ensure_ascii=False))
-                sys.exit(0)
-except Exception as e:
-    # If deterministic path fails, we continue to LLM
-    pass
-
-# Set up SmartDataframe with Ollama (configurable model)
-model_name = os.environ.get("OLLAMA_MODEL", "llama3:8b")
-print("DEBUG: using Ollama model:", model_name, file=sys.stderr)
-llm = Ollama(model=model_name)
-sdf = SmartDataframe(df, config={"llm": llm, "save_logs": False})
-
-# Improved prompt for robust code generation
-wrapped_question = (
-    "You are working with a pandas DataFrame named `df`.\n"
-    "Never use `dfs`, `dfs[0]`, or any variable except `df`.\n"
-    "If you need to filter, use `df[...]` or `df.loc[...]` only.\n"
-    "Always return code inside triple backticks.\n"
-    "If the answer is a single value, return code that extracts that value from the DataFrame and prints it.\n\n"
-    f"User question:\n{question}"
-)
+def _close_entry(entry):
+    if entry["con"] is not None:
+        entry["con"].close()
 
-try:
-    t0 = time.time()
-    result = sdf.chat(wrapped_question)
-    print("DEBUG: sdf.chat elapsed (s):", time.time() - t0, file=sys.stderr)
-    code = None
-    if isinstance(result, dict) and "code" in result:
-        code = result["code"]
-    elif hasattr(sdf, "last_code_executed"):
-        code = sdf.last_code_executed
-    output = {
-        "answer": result.get("answer") if isinstance(result, dict) else result,
-        "code": code
-    }
+
+def get_frame(json_file: str):
+    mtime = os.path.getmtime(json_file)
+    entry = _FRAME_CACHE.get(json_file)
+    if entry is not None and entry["mtime"] == mtime:
+        dbg("DEBUG: reusing cached DataFrame for:", json_file)
+        _FRAME_CACHE.move_to_end(json_file)
+        return entry
+    if entry is not None:
+        _close_entry(_FRAME_CACHE.pop(json_file))
+    df, meta = load_frame(json_file)
+    entry = _FRAME_CACHE[json_file] = {"mtime": mtime, "df": df, "meta": meta, "con": None}
+    # Evict least recently used documents beyond the bound
+    while len(_FRAME_CACHE) > _FRAME_CACHE_SIZE:
+        _, evicted = _FRAME_CACHE.popitem(last=False)
+        _close_entry(evicted)
+    return entry
+
+
+def ask_ollama(prompt: str) -> str:
+    model_name = os.environ.get("OLLAMA_MODEL", "llama3:8b")
+    base_path = os.environ.get("OLLAMA_BASE_PATH", "http://127.0.0.1:11434").rstrip("/")
+    dbg("DEBUG: using Ollama model:", model_name)
+    body = json.dumps({
+        "model": model_name,
+        "messages": [{"role": "user", "content": prompt}],
+        "stream": False,
+        "options": {"temperature": 0},
+    }).encode("utf-8")
+    req = urllib.request.Request(f"{base_path}/api/chat", data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=OLLAMA_TIMEOUT_SECONDS) as resp:
+        return json.load(resp)["message"]["content"]
+
+
+def extract_sql(text: str) -> str:
+    """Pull the SQL out of an LLM reply: the fenced block if there is one, else the whole reply."""
+    m = _SQL_BLOCK_RE.search(text)
+    return (m.group(1) if m else text).strip().rstrip(";").strip()
+
+
+def check_select(sql: str):
+    """Raise ValueError unless sql is a single read-only query."""
+    try:
+        tree = sqlglot.parse_one(sql, read="duckdb")
+    except sqlglot.errors.ParseError as e:
+        raise ValueError(f"Generated SQL does not parse: {str(e)}")
+    if not isinstance(tree, sqlglot.exp.Query):
+        raise ValueError(f"Generated SQL is not a SELECT statement: {tree.key.upper()}")
+
+
+def get_connection(entry):
+    if entry["con"] is None:
+        # No file or network access: generated SQL may only read the registered frame
+        con = duckdb.connect(config={"enable_external_access": False})
+        con.register("t", entry["df"])
+        entry["con"] = con
+    return entry["con"]
+
+
+def answer_with_llm(entry, question: str):
+    con = get_connection(entry)
+    schema = "\n".join(f"  {quote_ident(name)} {col_type}" for name, col_type, *_ in con.execute("DESCRIBE t").fetchall())
+
+    # Ask for SQL over the schema instead of pandas code, so the answer runs on DuckDB
+    prompt = (
+        "You write DuckDB SQL. There is exactly one table, named `t`, with these columns:\n"
+        f"{schema}\n\n"
+        "Answer the question with a single SELECT statement over `t`.\n"
+        "Quote column names with double quotes exactly as listed.\n"
+        "Return only the SQL inside triple backticks.\n\n"
+        f"Question:\n{question}"
+    )
+
+    sql = None
+    try:
+        t0 = time.time()
+        reply = ask_ollama(prompt)
+        dbg("DEBUG: Ollama elapsed (s):", time.time() - t0)
+        # Keep what the model produced as `code` even if it is rejected below
+        sql = extract_sql(reply) or reply
+        dbg("DEBUG: generated SQL:", sql)
+        check_select(sql)
+        result = con.execute(sql).fetchdf()
+        records = json.loads(result.to_json(orient="records", date_format="iso"))
+        # A single cell is the answer itself; anything larger goes back as rows
+        if len(records) == 1 and len(result.columns) == 1:
+            answer = next(iter(records[0].values()))
+        else:
+            answer = records
+        return {"answer": answer, "code": sql}
+    except Exception as e:
+        dbg("DEBUG: LLM SQL error:", str(e))
+        return {"error": f"LLM SQL error: {str(e)}", "code": sql}
+
+
+def handle(req):
+    """Answer one {"json_file", "question"} request; failures carry an "error" key."""
+    json_file = req.get("json_file")
+    question = req.get("question")
+    dbg("DEBUG: inputs:", {"json_file": json_file, "question": question})
+    if not isinstance(json_file, str) or not isinstance(question, str) or not json_file or not question:
+        return {"error": "Request requires json_file and question strings."}
+
+    # Load DataFrame from JSON file (expects structuredData.data)
+    if not os.path.exists(json_file):
+        return {"error": f"File not found: {json_file}"}
+    try:
+        entry = get_frame(json_file)
+    except LookupError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        return {"error": f"Failed to load DataFrame: {str(e)}"}
+
+    # Deterministic aggregator: handle patterns like "average <col> for the past N years"
+    try:
+        output = run_average_over_years(entry["df"], question, year_col=entry["meta"].get("year_col"))
+        if "error" not in output:
+            return {**output, "code": None}
+    except Exception:
+        # If deterministic path fails, we continue to LLM
+        pass
+    return answer_with_llm(entry, question)
+
+
+def serve():
+    # One JSON request per stdin line, one JSON response per stdout line
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            req = json.loads(line)
+        except ValueError as e:
+            output = {"error": f"Invalid request: {str(e)}"}
+        else:
+            if not isinstance(req, dict):
+                output = {"error": "Invalid request: expected a JSON object."}
+            else:
+                try:
+                    output = handle(req)
+                except Exception as e:
+                    # One bad request must not take the worker (and its queue) down
+                    import traceback
+                    traceback.print_exc(file=sys.stderr)
+                    output = {"error": f"Unexpected error: {str(e)}"}
+        print(json.dumps(output, ensure_ascii=False), flush=True)
+
+
+if __name__ == "__main__":
+    dbg("DEBUG: argv:", sys.argv)
+    if "--serve" in sys.argv:
+        serve()
+        sys.exit(0)
+
+    # Usage: python pandasai_query.py <json_file> <question>
+    if len(sys.argv) < 3:
+        print(json.dumps({"error": "Usage: python pandasai_query.py <json_file> <question> | --serve"}))
+        sys.exit(1)
+
+    output = handle({"json_file": sys.argv[1], "question": sys.argv[2]})
     print(json.dumps(output, ensure_ascii=False))
-except Exception as e:
-    code = getattr(sdf, "last_code_executed", None)
-    print("DEBUG: PandasAI error:", str(e), file=sys.stderr)
-    print(json.dumps({"error": f"PandasAI error: {str(e)}", "code": code}))
-    sys.exit(1)
+    if "error" in output:
+        sys.exit(1)
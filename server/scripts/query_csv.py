@@ -1,15 +1,102 @@
 import sys
-import pandas as pd
+import bisect
 import json
 import os
 import duckdb
+# fetchdf() needs pandas; import it here so execution_time_seconds times the query, not the import
+import pandas  # noqa: F401
 import time
 import logging
+from _cache import documents_dir, snapshot_path, write_snapshot
+from _debug import DEBUG, dbg
+from _tables import json_items, quote_ident, quote_literal, rows_to_arrow
 
 # Setup logging
 logging.basicConfig(filename='query_csv.log', level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 
-print("DEBUG: argv:", sys.argv, file=sys.stderr)
+def normalize_column(name) -> str:
+    return str(name).strip().lower().replace(' ', '_')
+
+def load_structured_json(con, table_name, json_path):
+    """Materialize metadata.structuredData.data from json_path as table_name inside DuckDB.
+
+    Returns the normalized column names, or None if the document has no structured rows.
+    """
+    con.execute(
+        "CREATE OR REPLACE TEMP TABLE _structured_rows AS "
+        "SELECT unnest(json_extract(metadata, '$.structuredData.data[*]')) AS r "
+        f"FROM read_json_auto({quote_literal(json_path)}, columns={{metadata: 'JSON'}}, maximum_object_size=1073741824)"
+    )
+    try:
+        structure = con.execute("SELECT json_group_structure(r) FROM _structured_rows").fetchone()[0]
+        fields = json.loads(structure) if structure else None
+        if not isinstance(fields, dict) or not fields:
+            return None
+        # Keys with mixed or only-null values come back as JSON/NULL; read them as text
+        fields = {k: "VARCHAR" if v in ("JSON", "NULL") else v for k, v in fields.items()}
+        columns = [normalize_column(k) for k in fields]
+        projection = ", ".join(f"{quote_ident(k)} AS {quote_ident(c)}" for k, c in zip(fields, columns))
+        con.execute(
+            f"CREATE OR REPLACE TEMP TABLE {quote_ident(table_name)} AS SELECT {projection} "
+            "FROM (SELECT UNNEST(json_transform(r, ?)) FROM _structured_rows)",
+            [json.dumps(fields)],
+        )
+        return columns
+    finally:
+        con.execute("DROP TABLE IF EXISTS _structured_rows")
+
+def load_csv(con, table_name, csv_path):
+    """Read a CSV file straight into DuckDB; values stay text like structuredData rows do."""
+    con.execute(
+        "CREATE OR REPLACE TEMP VIEW _csv_rows AS "
+        f"SELECT * FROM read_csv_auto({quote_literal(csv_path)}, header=true, all_varchar=true)"
+    )
+    try:
+        raw_columns = [row[0] for row in con.execute("DESCRIBE _csv_rows").fetchall()]
+        columns = [normalize_column(c) for c in raw_columns]
+        projection = ", ".join(f"{quote_ident(k)} AS {quote_ident(c)}" for k, c in zip(raw_columns, columns))
+        con.execute(f"CREATE OR REPLACE TEMP TABLE {quote_ident(table_name)} AS SELECT {projection} FROM _csv_rows")
+        return columns
+    finally:
+        con.execute("DROP VIEW IF EXISTS _csv_rows")
+
+def load_json_rows(con, table_name, json_path):
+    """Load structuredData.data (or "Row ..." lines in pageContent) in Python and register it."""
+    # Stream rows out of structuredData.data if present
+    data = json_items(json_path, "metadata.structuredData.data.item")
+    if data:
+        dbg("DEBUG: Using structuredData.data from JSON file")
+    else:
+        page_content = next(iter(json_items(json_path, "pageContent")), "")
+        for line in page_content.splitlines():
+            if line.strip().startswith("Row "):
+                row = {}
+                for part in line.split(", "):
+                    if ": " in part:
+                        k, v = part.split(": ", 1)
+                        row[k.strip()] = v.strip()
+                if row:
+                    data.append(row)
+        dbg("DEBUG: Used fallback pageContent parsing")
+    # Normalize column names on the Arrow table; DuckDB scans it directly
+    tbl = rows_to_arrow(data)
+    tbl = tbl.rename_columns([normalize_column(col) for col in tbl.column_names])
+    con.register(table_name, tbl)
+    return tbl.column_names
+
+def attach_parquet(con, table_name, cache_path):
+    con.execute(f"CREATE OR REPLACE VIEW {quote_ident(table_name)} AS SELECT * FROM read_parquet({quote_literal(cache_path)})")
+    return [row[0] for row in con.execute(f"DESCRIBE {quote_ident(table_name)}").fetchall()]
+
+def write_parquet_cache(con, table_name, json_path):
+    """Snapshot a loaded table to parquet so later queries skip JSON parsing."""
+    write_snapshot(
+        json_path,
+        "table",
+        lambda tmp_path: con.execute(f"COPY (SELECT * FROM {quote_ident(table_name)}) TO {quote_literal(tmp_path)} (FORMAT parquet)"),
+    )
+
+dbg("DEBUG: argv:", sys.argv)
 
 # Argument 1: JSON string mapping table names to doc IDs
 # Argument 2: SQL query string
@@ -19,74 +106,76 @@ table_map = json.loads(sys.argv[1])
 question = sys.argv[2]
 use_row_headers = sys.argv[3].lower() == "true" if len(sys.argv) > 3 else False
 
-print("DEBUG: parsed inputs:", {"table_map": table_map, "use_row_headers": use_row_headers}, file=sys.stderr)
+dbg("DEBUG: parsed inputs:", {"table_map": table_map, "use_row_headers": use_row_headers})
 
-data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../storage/documents/custom-documents"))
-print("DEBUG: data_dir:", data_dir, file=sys.stderr)
+data_dir = documents_dir
+dbg("DEBUG: data_dir:", data_dir)
 
 start_total = time.time()
 
-tables = {}
+# Index the directory once; each table lookup is then a few set probes plus
+# a binary search for the doc_id prefix match
+try:
+    entries = sorted(os.listdir(data_dir))
+except OSError as e:
+    dbg("DEBUG: failed to list data_dir:", str(e))
+    entries = []
+entry_set = set(entries)
+dbg("DEBUG: directory listing count:", len(entries))
+
+def find_document(doc_id, table_name):
+    doc_id = str(doc_id)
+    for name in (doc_id, doc_id + '.csv', table_name, table_name + '.csv'):
+        if name in entry_set:
+            return name
+    i = bisect.bisect_left(entries, doc_id)
+    if i < len(entries) and entries[i].startswith(doc_id):
+        return entries[i]
+    return None
+
+con = duckdb.connect()
 schema_info = {}
 for table_name, doc_id in table_map.items():
-    json_path = None
-    try:
-        print("DEBUG: directory listing count:", len(os.listdir(data_dir)), file=sys.stderr)
-    except Exception as e:
-        print("DEBUG: failed to list data_dir:", str(e), file=sys.stderr)
-    print("DEBUG: Looking for doc_id:", doc_id, "or table_name:", table_name, file=sys.stderr)
-    for fname in os.listdir(data_dir):
-        if fname == str(doc_id) or fname == str(doc_id) + '.csv' or fname.startswith(str(doc_id)) or fname == table_name or fname == table_name + '.csv':
-            json_path = os.path.join(data_dir, fname)
-            break
+    dbg("DEBUG: Looking for doc_id:", doc_id, "or table_name:", table_name)
+    fname = find_document(doc_id, table_name)
+    json_path = os.path.join(data_dir, fname) if fname else None
     if not json_path or not os.path.exists(json_path):
-        print(f"DEBUG: Could not find file for doc_id: {doc_id} in {data_dir}", file=sys.stderr)
-        print(f"DEBUG: Files present: {os.listdir(data_dir)}", file=sys.stderr)
+        dbg(f"DEBUG: Could not find file for doc_id: {doc_id} in {data_dir}")
         error_msg = f"Document not found for table '{table_name}' (doc_id: {doc_id})"
         logging.error(error_msg)
         print(json.dumps({"error": error_msg}))
         sys.exit()
-    if json_path:
-        print("DEBUG: Found file at:", json_path, file=sys.stderr)
-        with open(json_path, "r", encoding="utf-8") as f:
-            preview = f.read(500)
-            print("DEBUG: File preview (first 500 chars):", preview, file=sys.stderr)
-            f.seek(0)
+    dbg("DEBUG: Found file at:", json_path)
     try:
         load_start = time.time()
-        with open(json_path, "r", encoding="utf-8") as f:
-            doc = json.load(f)
-        # Use structuredData.data if present
-        data = None
-        if (
-            "metadata" in doc
-            and "structuredData" in doc["metadata"]
-            and "data" in doc["metadata"]["structuredData"]
-        ):
-            data = doc["metadata"]["structuredData"]["data"]
-            print("DEBUG: Using structuredData.data from JSON file", file=sys.stderr)
+        cache_path = snapshot_path(json_path, "table")
+        if os.path.exists(cache_path):
+            dbg("DEBUG: Using parquet cache:", cache_path)
+            columns = attach_parquet(con, table_name, cache_path)
+        elif json_path.lower().endswith(".csv"):
+            # Plain CSV on disk: bytes go file -> DuckDB vectors without a pandas detour
+            dbg("DEBUG: Reading CSV directly with DuckDB")
+            columns = load_csv(con, table_name, json_path)
+            write_parquet_cache(con, table_name, json_path)
         else:
-            data = []
-            page_content = doc.get("pageContent", "")
-            for line in page_content.splitlines():
-                if line.strip().startswith("Row "):
-                    row = {}
-                    for part in line.split(", "):
-                        if ": " in part:
-                            k, v = part.split(": ", 1)
-                            row[k.strip()] = v.strip()
-                    if row:
-                        data.append(row)
-            print("DEBUG: Used fallback pageContent parsing", file=sys.stderr)
-        df = pd.DataFrame(data)
-        df.columns = [str(col).strip().lower().replace(' ', '_') for col in df.columns]
-        print("DEBUG: DataFrame columns:", df.columns.tolist(), file=sys.stderr)
-        print("DEBUG: DataFrame head:\n", df.head(), file=sys.stderr)
-        print("DEBUG: DataFrame tail:\n", df.tail(), file=sys.stderr)
-        print("DEBUG: DataFrame shape:", df.shape, file=sys.stderr)
-        print("DEBUG: load time (s):", time.time() - load_start, file=sys.stderr)
-        tables[table_name] = df
-        schema_info[table_name] = list(df.columns)
+            # Let DuckDB's JSON reader parse structuredData.data straight into a typed table
+            try:
+                columns = load_structured_json(con, table_name, json_path)
+            except duckdb.Error as e:
+                dbg("DEBUG: DuckDB JSON reader failed, falling back to Python loader:", str(e))
+                columns = None
+            if columns is not None:
+                dbg("DEBUG: Using structuredData.data from JSON file")
+            else:
+                columns = load_json_rows(con, table_name, json_path)
+            write_parquet_cache(con, table_name, json_path)
+        dbg("DEBUG: Table columns:", columns)
+        if DEBUG:
+            # Formatting a preview runs extra queries; only pay for it when debugging
+            dbg("DEBUG: Table head:\n", con.execute(f"SELECT * FROM {quote_ident(table_name)} LIMIT 5").fetchdf())
+            dbg("DEBUG: Table rows:", con.execute(f"SELECT COUNT(*) FROM {quote_ident(table_name)}").fetchone()[0])
+        dbg("DEBUG: load time (s):", time.time() - load_start)
+        schema_info[table_name] = columns
     except Exception as e:
         error_msg = f"Failed to load or parse data for table '{table_name}': {str(e)}"
         logging.error(error_msg)
@@ -95,10 +184,7 @@ for table_name, doc_id in table_map.items():
 
 # Execute the question via DuckDB safely
 try:
-    con = duckdb.connect()
-    for table_name, df in tables.items():
-        con.register(table_name, df)
-    print("DEBUG: SQL query to execute:", question, file=sys.stderr)
+    dbg("DEBUG: SQL query to execute:", question)
     start_time = time.time()
     result = con.execute(question).fetchdf()
     elapsed = time.time() - start_time
@@ -112,10 +198,11 @@ try:
     output = {"answer": answer, "metadata": metadata}
     print(json.dumps(output))
     logging.info(f"Query succeeded: {question}")
-    print("DEBUG: SQL query result head:\n", result.head(), file=sys.stderr)
-    print("DEBUG: SQL query result shape:", result.shape, file=sys.stderr)
+    if DEBUG:
+        dbg("DEBUG: SQL query result head:\n", result.head())
+    dbg("DEBUG: SQL query result shape:", result.shape)
     con.close()
-    print("DEBUG: total python time (s):", time.time() - start_total, file=sys.stderr)
+    dbg("DEBUG: total python time (s):", time.time() - start_total)
 except Exception as e:
     import traceback
     traceback.print_exc(file=sys.stderr)
@@ -0,0 +1,30 @@
+"""Edge cases for the average-over-years aggregator.
+
+Run from server/scripts with: python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+import pyarrow as pa
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from _agg import run_average_over_years  # noqa: E402
+
+
+class YearsBackTest(unittest.TestCase):
+    def setUp(self):
+        self.tbl = pa.table({"Year": ["2019", "2020", "2021", "2022"], "Score": ["1", "2", "3", "4"]})
+
+    def test_years_back_beyond_bigint_covers_every_year(self):
+        output = run_average_over_years(self.tbl, "average score for the past 99999999999999999999 years")
+        self.assertEqual(output, {"answer": "Average Score over past 99999999999999999999 years: 2.5000"})
+
+    def test_years_back_selects_most_recent_years(self):
+        output = run_average_over_years(self.tbl, "average score for the past 2 years")
+        self.assertEqual(output, {"answer": "Average Score over past 2 years: 3.5000"})
+
+
+if __name__ == "__main__":
+    unittest.main()
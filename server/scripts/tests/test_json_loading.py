@@ -0,0 +1,46 @@
+"""Loading structuredData rows that the C JSON backend cannot parse.
+
+Run from server/scripts with: python -m unittest discover -s tests
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from _agg import run_average_over_years  # noqa: E402
+from _tables import json_items, rows_to_arrow  # noqa: E402
+
+ROWS_PREFIX = "metadata.structuredData.data.item"
+
+
+class LargeIntegerTest(unittest.TestCase):
+    def setUp(self):
+        # A 23-digit id overflows int64, which yajl rejects outright
+        rows = [{"Year": str(2015 + i), "Score": str(1 + i % 3), "ID": 12345678901234567890123 + i} for i in range(8)]
+        fd, self.path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"pageContent": "", "metadata": {"structuredData": {"data": rows}}}, f)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_rows_load_with_big_integers(self):
+        data = json_items(self.path, ROWS_PREFIX)
+        self.assertEqual(len(data), 8)
+        self.assertEqual(data[0]["ID"], 12345678901234567890123)
+
+    def test_big_integer_column_falls_back_to_strings(self):
+        tbl = rows_to_arrow(json_items(self.path, ROWS_PREFIX))
+        self.assertEqual(tbl.column("ID")[0].as_py(), "12345678901234567890123")
+
+    def test_aggregate_over_document_with_big_integers(self):
+        tbl = rows_to_arrow(json_items(self.path, ROWS_PREFIX))
+        output = run_average_over_years(tbl, "average score for the past 5 years")
+        self.assertEqual(output, {"answer": "Average Score over past 5 years: 1.8000"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -207,7 +207,7 @@ async function streamChatWithWorkspace(
 
     for (const source of csvSources) {
       try {
-        // Call local REST endpoint which supports SQL and PandasAI routing
+        // Call local REST endpoint which supports SQL and natural-language routing
         const res = await fetch("http://localhost:3001/api/query-csv", {
           method: "POST",
           headers: { "Content-Type": "application/json" },
@@ -235,9 +235,12 @@ async function streamChatWithWorkspace(
             formattedResult = JSON.stringify(result.answer, null, 2);
           } else if (typeof result.answer === 'string') {
             formattedResult = result.answer;
+          } else if (result.answer !== undefined && result.answer !== null) {
+            // Single-value SQL results come back as a bare number/boolean
+            formattedResult = String(result.answer);
           }
           if (result.code) {
-            formattedResult += `\n\nCode used (from PandasAI):\n\n\`\`\`python\n${result.code}\n\`\`\``;
+            formattedResult += `\n\nSQL used:\n\n\`\`\`sql\n${result.code}\n\`\`\``;
           }
 
           // Add the query result to the context
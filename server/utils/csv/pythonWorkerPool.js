@@ -0,0 +1,105 @@
+const path = require("path");
+const { PythonShell } = require("python-shell");
+
+/**
+ * Keeps a small set of long-lived Python workers running a script in `--serve`
+ * mode, so interpreter start-up, imports and any per-file caches are paid once
+ * instead of on every request. Each worker reads one JSON request per stdin line
+ * and answers with one JSON response per stdout line, in order.
+ */
+class PythonWorkerPool {
+  #scriptPath;
+  #size;
+  #workers = [];
+
+  /**
+   * @param {string} scriptFullPath - Absolute path to the Python script
+   * @param {number} [size] - Maximum number of worker processes
+   */
+  constructor(scriptFullPath, size = 2) {
+    this.#scriptPath = scriptFullPath;
+    this.#size = Math.max(1, Number(size) || 1);
+  }
+
+  #log(text, ...args) {
+    console.log(
+      `\x1b[36m[PythonWorkerPool:${path.basename(this.#scriptPath)}]\x1b[0m ${text}`,
+      ...args
+    );
+  }
+
+  #spawn() {
+    const worker = { pending: [], stderr: "", shell: null };
+    worker.shell = new PythonShell(path.basename(this.#scriptPath), {
+      mode: "text",
+      pythonOptions: ["-u"],
+      scriptPath: path.dirname(this.#scriptPath),
+      args: ["--serve"],
+    });
+
+    worker.shell.on("message", (line) => {
+      let parsed;
+      try {
+        parsed = JSON.parse(line);
+      } catch {
+        // Stray non-protocol output (e.g. a library print) - not a response
+        this.#log("ignoring non-JSON stdout line:", line);
+        return;
+      }
+      const job = worker.pending.shift();
+      if (!job) return;
+      const stderr = worker.stderr;
+      worker.stderr = "";
+      if (parsed?.error) {
+        return job.resolve({ success: false, error: parsed.error, stderr, parsed });
+      }
+      job.resolve({ success: true, parsed, stderr });
+    });
+    worker.shell.on("stderr", (m) => {
+      worker.stderr += String(m);
+    });
+    worker.shell.on("error", (err) => {
+      this.#log("worker error event:", err.message);
+    });
+    worker.shell.on("close", () => {
+      this.#workers = this.#workers.filter((w) => w !== worker);
+      this.#log("worker exited with", worker.pending.length, "pending request(s)");
+      for (const job of worker.pending.splice(0)) {
+        job.resolve({ success: false, error: "Python worker exited", stderr: worker.stderr });
+      }
+    });
+
+    this.#workers.push(worker);
+    this.#log("spawned worker", this.#workers.length, "of", this.#size);
+    return worker;
+  }
+
+  /** Least-busy live worker, spawning a new one while the pool is not full. */
+  #pick() {
+    const idle = this.#workers.find((w) => w.pending.length === 0);
+    if (idle) return idle;
+    if (this.#workers.length < this.#size) return this.#spawn();
+    return this.#workers.reduce((a, b) => (b.pending.length < a.pending.length ? b : a));
+  }
+
+  /**
+   * Send a request to a worker.
+   * @param {object} payload - JSON-serializable request for the script
+   * @returns {Promise<{success: boolean, parsed?: any, error?: string, stderr: string}>}
+   */
+  run(payload) {
+    const t0 = Date.now();
+    const worker = this.#pick();
+    return new Promise((resolve) => {
+      worker.pending.push({
+        resolve: (result) => {
+          this.#log("request finished:", { ms: Date.now() - t0, success: result.success });
+          resolve(result);
+        },
+      });
+      worker.shell.send(JSON.stringify(payload));
+    });
+  }
+}
+
+module.exports = { PythonWorkerPool };
@@ -1,6 +1,6 @@
 const csvQueryPrompt = `You are a data analysis expert. Your task is to help analyze CSV data using natural language.
 
-The data is loaded into a pandas DataFrame. You can ask questions about the data in natural language, and PandasAI will help analyze it.
+The data is loaded into a DuckDB table. You can ask questions about the data in natural language, and each question is answered by a single read-only SQL query over that table.
 
 Here are some examples of questions you can ask:
 